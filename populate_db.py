@@ -3,9 +3,17 @@
 Script to populate AstraDB with product data
 """
 import sys
+import argparse
 from product_assistant.etl.data_ingestion import DataIngestion
 
 def main():
+    parser = argparse.ArgumentParser(description="Populate AstraDB with product data")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Documents per embedding call / bulk insert (default: 100)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Batches embedded and inserted in parallel (default: library default)")
+    args = parser.parse_args()
+
     print("🚀 Starting data ingestion to populate AstraDB...")
     
     try:
@@ -13,7 +21,7 @@ def main():
         ingestion = DataIngestion()
         
         print("📡 Running ingestion pipeline...")
-        ingestion.run_pipeline()
+        ingestion.run_pipeline(batch_size=args.batch_size, concurrency=args.concurrency)
         
         print("✅ Data successfully ingested to AstraDB!")
         print("🎉 The vector database is now populated with product data!")
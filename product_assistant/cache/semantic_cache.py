@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from product_assistant.logger import GLOBAL_LOGGER as log
+
+# Tokens that identify a specific model ("15", "s24", "128gb", "pro"): queries
+# that differ only in these embed almost identically but must never share an entry
+_MODEL_TOKEN_RE = re.compile(r"\b(?:\w*\d\w*|pro|max|plus|mini|ultra|lite|fe)\b", re.IGNORECASE)
+
+
+class SemanticCache:
+    """
+    In-process cache keyed by query embedding.
+
+    Lookups try an exact hash of the normalized query first and only then
+    embed the query and scan cached entries by cosine similarity, so
+    near-duplicate queries ("price of iPhone 15" / "iPhone 15 price") hit.
+    A similarity hit also requires the same model tokens, so "iPhone 14" never
+    reuses the entry for "iPhone 15".
+    Entries expire after `ttl_seconds` and the least recently used entry is
+    evicted once `max_size` is reached.
+    """
+
+    def __init__(self, embeddings, threshold: float = 0.92, ttl_seconds: float = 600, max_size: int = 256):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        # key -> (unit-norm embedding, value, expiry, model tokens)
+        self._entries: OrderedDict = OrderedDict()
+        # Embeddings computed on a miss, reused by the following set()
+        self._pending: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---------- Helpers ----------
+    @staticmethod
+    def _key(query: str) -> str:
+        return hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _model_tokens(query: str) -> frozenset:
+        return frozenset(token.lower() for token in _MODEL_TOKEN_RE.findall(query))
+
+    async def _aembed(self, query: str):
+        # Embedding clients built outside the running loop cannot use their
+        # async API (it is bound to another loop); embed on a worker thread
+        return await asyncio.to_thread(self.embeddings.embed_query, query)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _get_exact(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def _get_similar(self, key: str, vector, tokens: frozenset):
+        query_vec = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            self._pending[key] = query_vec
+            while len(self._pending) > self.max_size:
+                self._pending.popitem(last=False)
+            for expired in [k for k, entry in self._entries.items() if entry[2] < now]:
+                del self._entries[expired]
+            keys = [k for k, entry in self._entries.items() if entry[3] == tokens]
+            if not keys:
+                return None
+            matrix = np.vstack([self._entries[k][0] for k in keys])
+            scores = matrix @ query_vec
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._entries.move_to_end(keys[best])
+            log.info("Semantic cache hit", score=float(scores[best]))
+            return self._entries[keys[best]][1]
+
+    def _store(self, key: str, vector, value, tokens: frozenset):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._entries[key] = (self._normalize(vector), value, time.monotonic() + self.ttl_seconds, tokens)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # ---------- Public API ----------
+    def get(self, query: str):
+        """Return the cached value for `query` or a near-duplicate of it, else None."""
+        key = self._key(query)
+        value = self._get_exact(key)
+        if value is not None:
+            return value
+        try:
+            vector = self.embeddings.embed_query(query)
+        except Exception as e:
+            log.warning("Semantic cache embedding failed", error=str(e))
+            return None
+        return self._get_similar(key, vector, self._model_tokens(query))
+
+    def set(self, query: str, value):
+        key = self._key(query)
+        vector = self._pending.get(key)
+        if vector is None:
+            try:
+                vector = self.embeddings.embed_query(query)
+            except Exception as e:
+                log.warning("Semantic cache embedding failed", error=str(e))
+                return
+        self._store(key, vector, value, self._model_tokens(query))
+
+    async def aget(self, query: str):
+        """Async variant of get()."""
+        key = self._key(query)
+        value = self._get_exact(key)
+        if value is not None:
+            return value
+        try:
+            vector = await self._aembed(query)
+        except Exception as e:
+            log.warning("Semantic cache embedding failed", error=str(e))
+            return None
+        return self._get_similar(key, vector, self._model_tokens(query))
+
+    async def aset(self, query: str, value):
+        """Async variant of set()."""
+        key = self._key(query)
+        vector = self._pending.get(key)
+        if vector is None:
+            try:
+                vector = await self._aembed(query)
+            except Exception as e:
+                log.warning("Semantic cache embedding failed", error=str(e))
+                return
+        self._store(key, vector, value, self._model_tokens(query))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
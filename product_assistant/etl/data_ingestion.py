@@ -1,7 +1,7 @@
 import os
 import pandas as pd
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
 from langchain_core.documents import Document
 from langchain_astradb import AstraDBVectorStore
 from product_assistant.utils.model_loader import ModelLoader
@@ -98,14 +98,22 @@ class DataIngestion:
         print(f"Transformed {len(documents)} documents.")
         return documents
 
-    def store_in_vector_db(self, documents: List[Document]):
+    def store_in_vector_db(self, documents: List[Document], batch_size: int = 100, concurrency: Optional[int] = None):
         """
         Store documents into AstraDB vector store.
+
+        AstraDBVectorStore splits the insert into bulk requests of `batch_size`
+        documents and keeps up to `concurrency` of them in flight at once
+        (the library default when None).
         """
         collection_name=self.config["astra_db"]["collection_name"]
         
         # Construct the full AstraDB endpoint URL
         api_endpoint = f"https://{self.db_database_id}-us-east-2.apps.astra.datastax.com"
+
+        insert_options = {"batch_size": batch_size}
+        if concurrency is not None:
+            insert_options["bulk_insert_batch_concurrency"] = max(1, concurrency)
         
         vstore = AstraDBVectorStore(
             embedding= self.model_loader.load_embeddings(),
@@ -113,18 +121,20 @@ class DataIngestion:
             api_endpoint=api_endpoint,
             token=self.db_application_token,
             namespace=self.db_keyspace,
+            **insert_options,
         )
 
         inserted_ids = vstore.add_documents(documents)
-        print(f"Successfully inserted {len(inserted_ids)} documents into AstraDB.")
+        print(f"Successfully inserted {len(inserted_ids)} documents into AstraDB "
+              f"(batches of up to {batch_size}).")
         return vstore, inserted_ids
 
-    def run_pipeline(self):
+    def run_pipeline(self, batch_size: int = 100, concurrency: Optional[int] = None):
         """
         Run the full data ingestion pipeline: transform data and store into vector DB.
         """
         documents = self.transform_data()
-        vstore, _ = self.store_in_vector_db(documents)
+        vstore, _ = self.store_in_vector_db(documents, batch_size=batch_size, concurrency=concurrency)
 
         #Optionally do a quick search
         query = "Can you tell me the low budget iphone?"
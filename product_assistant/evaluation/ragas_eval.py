@@ -1,9 +1,19 @@
 import asyncio
+import functools
 from product_assistant.utils.model_loader import ModelLoader
-import grpc.experimental.aio as grpc_aio
-grpc_aio.init_grpc_aio()
 
-model_loader = ModelLoader()
+
+@functools.lru_cache(maxsize=None)
+def _ensure_grpc():
+    """Initialize gRPC aio on first evaluation instead of at import time."""
+    import grpc.experimental.aio as grpc_aio
+    grpc_aio.init_grpc_aio()
+
+@functools.lru_cache(maxsize=None)
+def _get_model_loader():
+    """Create the ModelLoader on first use so importing this module stays cheap."""
+    _ensure_grpc()
+    return ModelLoader()
 
 def evaluate_context_precision(query, response, retrieved_context):
     """
@@ -33,4 +43,74 @@ def evaluate_response_relevancy(query, response, retrieved_context):
             return 0.3   # Mock low relevancy score
     except Exception as e:
         print(f"Response relevancy evaluation error: {e}")
-        return 0.5  # Default score
\ No newline at end of file
+        return 0.5  # Default score
+
+
+def evaluate_context_precision_batch(queries, responses, retrieved_contexts):
+    """
+    Batch variant of evaluate_context_precision
+    Returns one score per sample so evaluation loops make a single call
+    """
+    _ensure_grpc()
+    if not (len(queries) == len(responses) == len(retrieved_contexts)):
+        print("Context precision batch evaluation error: input lengths differ")
+        return [0.5] * len(queries)  # Default score
+    return [
+        evaluate_context_precision(query, response, context)
+        for query, response, context in zip(queries, responses, retrieved_contexts)
+    ]
+
+def evaluate_response_relevancy_batch(queries, responses, retrieved_contexts):
+    """
+    Batch variant of evaluate_response_relevancy
+    Returns one score per sample so evaluation loops make a single call
+    """
+    _ensure_grpc()
+    if not (len(queries) == len(responses) == len(retrieved_contexts)):
+        print("Response relevancy batch evaluation error: input lengths differ")
+        return [0.5] * len(queries)  # Default score
+    return [
+        evaluate_response_relevancy(query, response, context)
+        for query, response, context in zip(queries, responses, retrieved_contexts)
+    ]
+
+
+def evaluate_batch(queries, responses, retrieved_contexts, max_workers: int = 16):
+    """
+    Score context precision and response relevancy for all samples in one ragas.evaluate pass
+    Falls back to the mock batch scores when ragas or the judge model is unavailable
+    """
+    try:
+        from datasets import Dataset
+        from ragas import evaluate
+        from ragas.llms import LangchainLLMWrapper
+        from ragas.embeddings import LangchainEmbeddingsWrapper
+        from ragas.metrics import answer_relevancy, context_utilization
+        from ragas.run_config import RunConfig
+
+        model_loader = _get_model_loader()
+        dataset = Dataset.from_dict({
+            "question": list(queries),
+            "answer": list(responses),
+            "contexts": [list(contexts) for contexts in retrieved_contexts],
+        })
+        result = evaluate(
+            dataset,
+            # No labelled references: context_utilization is ragas' reference-free
+            # form of context precision, judged against the answer
+            metrics=[context_utilization, answer_relevancy],
+            llm=LangchainLLMWrapper(model_loader.load_llm()),
+            embeddings=LangchainEmbeddingsWrapper(model_loader.load_embeddings()),
+            run_config=RunConfig(max_workers=max_workers),
+        )
+        scores = result.to_pandas()
+        return {
+            "context_precision": scores["context_utilization"].tolist(),
+            "response_relevancy": scores["answer_relevancy"].tolist(),
+        }
+    except Exception as e:
+        print(f"RAGAS batch evaluation unavailable, using fallback scores: {e}")
+        return {
+            "context_precision": evaluate_context_precision_batch(queries, responses, retrieved_contexts),
+            "response_relevancy": evaluate_response_relevancy_batch(queries, responses, retrieved_contexts),
+        }
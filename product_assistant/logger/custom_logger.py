@@ -34,12 +34,15 @@ class CustomLogger:
         # Configure structlog for JSON structured logging
         structlog.configure(
             processors=[
+                # Drop events below the stdlib level before any rendering work
+                structlog.stdlib.filter_by_level,
                 structlog.processors.TimeStamper(fmt="iso", utc=True, key="timestamp"),
                 structlog.processors.add_log_level,
                 structlog.processors.EventRenamer(to="event"),
                 structlog.processors.JSONRenderer()
             ],
             logger_factory=structlog.stdlib.LoggerFactory(),
+            wrapper_class=structlog.stdlib.BoundLogger,
             cache_logger_on_first_use=True,
         )
 
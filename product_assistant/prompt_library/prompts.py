@@ -27,6 +27,20 @@ class PromptTemplate:
     def required_placeholders(self):
         return [field_name for _, field_name, _, _ in string.Formatter().parse(self.template) if field_name]
 
+    def split_static_prefix(self):
+        """
+        Split the template into (static, dynamic) at the paragraph holding the
+        first placeholder, so the instruction prefix can be sent as a stable
+        system message and reused by provider-side prompt caching.
+        """
+        first = self.template.find("{")
+        if first == -1:
+            return self.template, ""
+        cut = self.template.rfind("\n\n", 0, first)
+        if cut == -1:
+            return "", self.template
+        return self.template[:cut].strip(), self.template[cut:].strip()
+
 
 # Central Registry
 PROMPT_REGISTRY: Dict[PromptType, PromptTemplate] = {
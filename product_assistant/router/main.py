@@ -31,6 +31,6 @@ async def index(request: Request):
 async def chat(msg: str = Form(...)):
     """Call the Agentic RAG workflow."""
     rag_agent = AgenticRAG()
-    answer = rag_agent.run(msg)   # run() already returns final answer string
+    answer = await rag_agent.arun(msg)   # arun() already returns final answer string
     print(f"Agentic Response: {answer}")
     return answer
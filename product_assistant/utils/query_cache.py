@@ -0,0 +1,69 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def prompt_hash(template: str) -> str:
+    """Short stable hash of a prompt template, used to namespace cache keys."""
+    return hashlib.blake2b(template.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with TTL for retriever and LLM results.
+
+    Keys are the blake2b digest of (query, namespace); pass a prompt hash as
+    the namespace so a prompt change never serves stale answers.
+    """
+
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # key -> (value, expiry)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _key(query: str, namespace: str = "") -> bytes:
+        return hashlib.blake2b(f"{namespace}\x00{query}".encode("utf-8"), digest_size=16).digest()
+
+    def get(self, query: str, namespace: str = ""):
+        """Return the cached value for `query`, or None on a miss or expiry."""
+        key = self._key(query, namespace)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, query: str, value, namespace: str = ""):
+        key = self._key(query, namespace)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
@@ -1,69 +1,142 @@
 import os
-from typing import Annotated, Sequence, TypedDict, Literal
+import re
+import logging
+import asyncio
+import functools
+import time
+from typing import Annotated, Sequence, TypedDict
 from langchain_core.messages import BaseMessage, HumanMessage
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from tavily import TavilyClient
+from tavily import AsyncTavilyClient
 from product_assistant.prompt_library.prompts import PROMPT_REGISTRY, PromptType
 from product_assistant.retriever.retrieval import Retriever
 from product_assistant.utils.model_loader import ModelLoader
-from langgraph.checkpoint.memory import MemorySaver
+from product_assistant.cache.semantic_cache import SemanticCache
+from product_assistant.workflow.checkpointer import FastMemorySaver
+from product_assistant.workflow.graph_nodes import ROUTE_KEYWORDS, AgentRunner, agent_node
+from product_assistant.logger import GLOBAL_LOGGER as log
 
 
+RETRIEVER_TTL_SECONDS = 3600
+# Tavily result counts: cheap first attempt, wider retry when nothing was usable
+WEB_SEARCH_MAX_RESULTS = (3, 10)
 
-class AgenticRAG:
+# ₹64,900 | Rs. 64,900 | INR 64,900 | $799
+_PRICE_RE = re.compile(r"₹[\d,]+|Rs\.?\s*[\d,]+|INR\s*[\d,]+|\$[\d,]+")
+_NON_ALNUM = re.compile(r'[^a-zA-Z0-9]')
+# Apology/fallback phrases that mean the answer should come from web search
+_APOLOGY_PHRASES = ("i am sorry", "cannot provide", "not included", "no relevant documents", "not found")
+_APOLOGY_RE = re.compile("|".join(map(re.escape, _APOLOGY_PHRASES)), re.IGNORECASE)
+_APOLOGY_MAX_LEN = max(map(len, _APOLOGY_PHRASES))
+# "price of iPhone 15?" / "cost of ..." -> product phrase, for the direct price fast path
+_PRICE_QUERY_RE = re.compile(r"\b(?:price|cost)\s+of\b(?P<product>.+)", re.IGNORECASE)
+_MISSING_PRICES = frozenset(["", "None", "N/A", "nan"])
+
+
+def _normalize(text: str) -> str:
+    return _NON_ALNUM.sub('', text).lower()
+
+
+def _echoes_query(text: str, query: str, query_norm: str) -> bool:
+    """True when `text` is just the query again (ignoring case and punctuation)."""
+    # Only scan texts short enough to plausibly normalize to the query
+    return len(text) < 2 * len(query) and _normalize(text) == query_norm
+
+
+def _direct_price_answer(query: str, docs):
+    """Answer "price/cost of <product>" from doc metadata when exactly one catalog title matches."""
+    match = _PRICE_QUERY_RE.search(query)
+    if not match:
+        return None
+    product = match.group("product")
+    product_norm = _normalize(product)
+    if not product_norm:
+        return None
+    product_tokens = SemanticCache._model_tokens(product)
+    candidates = {}
+    for d in docs:
+        meta = d.metadata or {}
+        title, price = meta.get("product_title"), meta.get("price")
+        if not title or str(price).strip() in _MISSING_PRICES:
+            continue
+        if product_norm not in _normalize(str(title)):
+            continue
+        # "iPhone 15" must not match "iPhone 15 Pro Max": the title must carry the
+        # query's model tokens and may only add bare numbers (storage, year)
+        title_tokens = SemanticCache._model_tokens(str(title))
+        if product_tokens <= title_tokens and all(t.isdigit() for t in title_tokens - product_tokens):
+            candidates[title] = price
+    if len(candidates) != 1:
+        return None
+    title, price = next(iter(candidates.items()))
+    return f"The price of {title} is {price}."
+
+
+def _route_after_retrieval(state) -> str:
+    if state.get("direct_answer"):
+        return END
+    if "TOOL: websearch" in [msg.content for msg in state["messages"]]:
+        return "WebSearch"
+    return "generator"
+
+
+def _format_doc(d) -> str:
+    meta = d.metadata or {}
+    return (
+        f"Title: {meta.get('product_title', 'N/A')}\n"
+        f"Price: {meta.get('price', 'N/A')}\n"
+        f"Rating: {meta.get('rating', 'N/A')}\n"
+        f"Reviews:\n{d.page_content.strip()}"
+    )
+
+
+class AgenticRAG(AgentRunner):
     """Agentic RAG pipeline using LangGraph."""
 
     class AgentState(TypedDict):
         messages: Annotated[Sequence[BaseMessage], add_messages]
+        web_context: str
+        query_norm: str
+        direct_answer: bool
 
     def __init__(self):
         self.retriever_obj = Retriever()
+        self._retriever = self.retriever_obj.load_retriever()
+        self._retriever_ts = time.monotonic()
         self.model_loader = ModelLoader()
         self.llm = self.model_loader.load_llm()
-        self.checkpointer = MemorySaver()
-        self.workflow = self._build_workflow()
+        # Prompts and chains are immutable runnables: build them once and reuse
+        self._assistant_chain = ChatPromptTemplate.from_template(
+            "You are a helpful assistant. Answer the user directly.\n\nQuestion: {question}\nAnswer:"
+        ) | self.llm | StrOutputParser()
+        self._generate_prompt = ChatPromptTemplate.from_template(
+            PROMPT_REGISTRY[PromptType.PRODUCT_BOT].template
+        )
+        self._generate_chain = self._generate_prompt | self.llm | StrOutputParser()
+        embeddings = self.model_loader.load_embeddings()
+        self._web_cache = SemanticCache(embeddings)
+        self._retrieval_cache = SemanticCache(embeddings)
+        # Shared Tavily client keeps its HTTP connections alive across searches
+        tavily_api_key = os.getenv("TAVILY_API_KEY")
+        self._atavily = AsyncTavilyClient(api_key=tavily_api_key) if tavily_api_key else None
+        self.checkpointer = FastMemorySaver()
+        # The graph topology is the same for every instance: build it once per class
+        self.workflow = type(self)._compiled_template()
         self.app = self.workflow.compile(checkpointer=self.checkpointer)
 
     # ---------- Helpers ----------
     def _format_docs(self, docs) -> str:
-        import logging
         if not docs:
-            logging.info("No documents found for query.")
+            log.info("No documents found for query.")
             return "No relevant documents found."
-        formatted_chunks = []
-        for d in docs:
-            meta = d.metadata or {}
-            logging.info(f"Full document metadata: {meta}")
-            if 'price' in meta:
-                logging.info(f"Price field found: {meta['price']}")
-            else:
-                logging.warning("Price field missing in metadata!")
-            formatted = (
-                f"Title: {meta.get('product_title', 'N/A')}\n"
-                f"Price: {meta.get('price', 'N/A')}\n"
-                f"Rating: {meta.get('rating', 'N/A')}\n"
-                f"Reviews:\n{d.page_content.strip()}"
-            )
-            formatted_chunks.append(formatted)
-        return "\n\n---\n\n".join(formatted_chunks)
-    def web_search(self, query):
-        import logging
-        TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
-        if not TAVILY_API_KEY:
-            logging.error("TAVILY_API_KEY environment variable not set.")
-            return "Web search failed: API key not set."
-        client = TavilyClient(api_key=TAVILY_API_KEY)
-        # Refine query for price extraction
-        refined_query = f"{query} price in India"
-        try:
-            response = client.search(refined_query, max_results=10)
-            logging.info(f"Raw Tavily web search response: {response}")
-        except Exception as e:
-            logging.error(f"Tavily API call failed: {e}")
-            return f"Web search failed: {e}"
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Formatting retrieved docs", prices=[(d.metadata or {}).get("price") for d in docs])
+        return "\n\n---\n\n".join(_format_doc(d) for d in docs)
+
+    def _parse_web_results(self, response) -> str:
         results = response.get('results', []) if isinstance(response, dict) else []
         if results:
             best_result = None
@@ -72,111 +145,151 @@ class AgenticRAG:
                     content = result.get("content", "")
                     title = result.get("title", "Web Result")
                     url = result.get("url", "")
-                    import re
-                    price_patterns = [
-                        r"\₹[\d,]+",           # ₹64,900
-                        r"Rs\.?\s*[\d,]+",   # Rs. 64,900 or Rs 64,900
-                        r"INR\s*[\d,]+",      # INR 64,900
-                        r"\$[\d,]+"           # $799
-                    ]
-                    price = None
-                    for pat in price_patterns:
-                        match = re.search(pat, content)
-                        if match:
-                            price = match.group(0)
-                            break
+                    match = _PRICE_RE.search(content)
+                    price = match.group(0) if match else None
                     if price:
                         formatted = f"Title: {title}\nPrice: {price}\nDetails: {content}\nSource: {url}"
-                        logging.info(f"Formatted web search result: {formatted}")
+                        log.debug("Formatted web search result", result=formatted)
                         return formatted
                     # If no price, keep the first result for fallback
                     if not best_result:
                         best_result = f"Title: {title}\nDetails: {content}\nSource: {url}"
                 else:
-                    logging.warning(f"Unexpected result type: {type(result)} - {result}")
+                    log.warning("Unexpected result type", result_type=type(result).__name__)
                     continue
             # If no price found in any result, return best available info
             if best_result:
-                logging.info(f"No price found, returning best available web result: {best_result}")
+                log.info("No price found, returning best available web result")
+                log.debug("Best available web result", result=best_result)
                 return best_result
             else:
-                logging.warning("Web search returned results, but none were usable.")
+                log.warning("Web search returned results, but none were usable.")
                 return ""
         else:
-            logging.warning("Web search returned no results.")
+            log.warning("Web search returned no results.")
             return ""
 
+    async def aweb_search(self, query):
+        """Tavily web search for the query, async so it can run alongside the vector DB lookup."""
+        if self._atavily is None:
+            log.error("TAVILY_API_KEY environment variable not set.")
+            return "Web search failed: API key not set."
+        cached = await self._web_cache.aget(query)
+        if cached is not None:
+            return cached
+        refined_query = f"{query} price in India"
+        # Ask for a few results first; widen the search only if none was usable
+        for max_results in WEB_SEARCH_MAX_RESULTS:
+            try:
+                response = await self._atavily.search(refined_query, max_results=max_results)
+                log.debug("Raw Tavily web search response", response=response)
+            except Exception as e:
+                log.error("Tavily API call failed", error=str(e))
+                return f"Web search failed: {e}"
+            context = self._parse_web_results(response)
+            if context:
+                break
+        if context:
+            await self._web_cache.aset(query, context)
+        return context
+
+    def _get_retriever(self):
+        """Return the cached retriever, rebuilding the AstraDB connection once it is an hour old."""
+        if time.monotonic() - self._retriever_ts > RETRIEVER_TTL_SECONDS:
+            self.retriever_obj = Retriever()
+            self._retriever = self.retriever_obj.load_retriever()
+            self._retriever_ts = time.monotonic()
+        return self._retriever
+
+    async def aretrieve(self, query):
+        """Async vector DB lookup for the given query."""
+        # The cache lookup embeds the query on a miss; run the DB query alongside
+        # it instead of after it, and drop the DB query on a semantic hit.
+        # The retriever's embeddings hold a loop-bound async client created in
+        # __init__, so the sync lookup runs on a worker thread instead of ainvoke
+        docs_task = asyncio.create_task(asyncio.to_thread(self._get_retriever().invoke, query))
+        try:
+            cached = await self._retrieval_cache.aget(query)
+        except BaseException:
+            docs_task.cancel()
+            raise
+        if cached is not None:
+            docs_task.cancel()
+            return cached
+        docs = await docs_task
+        if docs:
+            await self._retrieval_cache.aset(query, docs)
+        return docs
+
     # ---------- Nodes ----------
+    def _prepare(self, state: AgentState):
+        # Normalize the incoming query once; later nodes compare against it
+        return {"query_norm": _normalize(state["messages"][-1].content), "direct_answer": False}
+
     def _ai_assistant(self, state: AgentState):
         print("--- CALL ASSISTANT ---")
         messages = state["messages"]
         last_message = messages[-1].content
 
-        if any(word in last_message.lower() for word in ["price", "review", "product"]):
+        text = last_message.lower()
+        if any(keyword in text for keyword in ROUTE_KEYWORDS):
             return {"messages": [HumanMessage(content="TOOL: retriever")]}
         else:
-            prompt = ChatPromptTemplate.from_template(
-                "You are a helpful assistant. Answer the user directly.\n\nQuestion: {question}\nAnswer:"
-            )
-            chain = prompt | self.llm | StrOutputParser()
-            response = chain.invoke({"question": last_message})
+            response = self._assistant_chain.invoke({"question": last_message})
             return {"messages": [HumanMessage(content=response)]}
 
-    def _vector_retriever(self, state: AgentState):
-        import logging
-        logging.info("Invoking vector DB lookup for query.")
+    async def _vector_retriever(self, state: AgentState):
+        log.info("Invoking vector DB lookup for query.")
         print("--- RETRIEVER ---")
         # Get the original user query (first message), not the "TOOL: retriever" message
         query = state["messages"][0].content
-        retriever = self.retriever_obj.load_retriever()
-        docs = retriever.invoke(query)
+        # Price queries often fall back to the web, so start the web search
+        # speculatively alongside the DB lookup; it is only awaited on a fallback.
+        docs_task = asyncio.create_task(self.aretrieve(query))
+        web_task = asyncio.create_task(self.aweb_search(query)) if "price" in query.lower() else None
+        try:
+            docs = await docs_task
+        except BaseException:
+            if web_task is not None:
+                web_task.cancel()
+            raise
+
         # Log all retrieved docs and their metadata
-        logging.info(f"All retrieved docs for query '{query}':")
-        for d in docs:
-            meta = getattr(d, 'metadata', {})
-            logging.info(f"Doc metadata: {meta}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("All retrieved docs for query", query=query, metadata=[getattr(d, 'metadata', {}) for d in docs])
         # Remove strict relevance filtering: treat all returned docs as relevant
         if docs:
-            logging.info(f"Vector DB returned {len(docs)} doc(s) for query '{query}'. Using all for response.")
+            log.info("Vector DB returned docs, using all for response", query=query, count=len(docs))
+            # "What is the price of X?" with one clear catalog match: answer without the LLM
+            direct = _direct_price_answer(query, docs)
+            if direct:
+                log.info("Answering price query directly from catalog metadata", query=query)
+                if web_task is not None:
+                    web_task.cancel()
+                return {"messages": [HumanMessage(content=f"[Source: Database]\n{direct}")],
+                        "web_context": "", "direct_answer": True}
             context = self._format_docs(docs)
             indicator = "[Source: Database]"
             # If context contains apology/fallback phrases, trigger web search
-            apology_phrases = [
-                "i am sorry",
-                "cannot provide",
-                "not included",
-                "no relevant documents",
-                "not found"
-            ]
-            context_lower = context.lower()
-            if any(phrase in context_lower for phrase in apology_phrases):
-                logging.info("DB response contains apology/fallback phrase. Triggering web search.")
-                return {"messages": [HumanMessage(content="TOOL: websearch"), HumanMessage(content=query)]}
-            return {"messages": [HumanMessage(content=f"{indicator}\n{context}")]}
+            if _APOLOGY_RE.search(context) is not None:
+                log.info("DB response contains apology/fallback phrase. Triggering web search.")
+                return {"messages": [HumanMessage(content="TOOL: websearch"), HumanMessage(content=query)],
+                        "web_context": await web_task if web_task is not None else ""}
+            # DB answer is good: the speculative web search is no longer needed
+            if web_task is not None:
+                web_task.cancel()
+            return {"messages": [HumanMessage(content=f"{indicator}\n{context}")], "web_context": ""}
         else:
-            logging.info(f"Vector DB returned no results for query '{query}'. Fallback to web search.")
-            return {"messages": [HumanMessage(content="TOOL: websearch"), HumanMessage(content=query)]}
-
-    def _grade_documents(self, state: AgentState) -> Literal["generator", "rewriter"]:
-        print("--- GRADER ---")
-        question = state["messages"][0].content
-        docs = state["messages"][-1].content
-
-        prompt = PromptTemplate(
-            template="""You are a grader. Question: {question}\nDocs: {docs}\n
-            Are docs relevant to the question? Answer yes or no.""",
-            input_variables=["question", "docs"],
-        )
-        chain = prompt | self.llm | StrOutputParser()
-        score = chain.invoke({"question": question, "docs": docs})
-        return "generator" if "yes" in score.lower() else "rewriter"
+            log.info("Vector DB returned no results. Fallback to web search.", query=query)
+            return {"messages": [HumanMessage(content="TOOL: websearch"), HumanMessage(content=query)],
+                    "web_context": await web_task if web_task is not None else ""}
 
-    def _generate(self, state: AgentState):
-        import logging
+    async def _generate(self, state: AgentState):
         print("--- GENERATE ---")
         question = state["messages"][0].content
         docs = state["messages"][-1].content
-        logging.info(f"Context passed to LLM:\n{docs}")
+        log.info("Context passed to LLM", context_chars=len(docs))
+        log.debug("LLM context", context=docs)
         # Detect source indicator in context
         indicator = ""
         if docs.startswith("[Source: Database]"):
@@ -185,52 +298,31 @@ class AgenticRAG:
         elif docs.startswith("[Source: Web Search]"):
             indicator = "[Source: Web Search]"
             docs = docs[len(indicator):].lstrip()
-        prompt = ChatPromptTemplate.from_template(
-            PROMPT_REGISTRY[PromptType.PRODUCT_BOT].template
-        )
-        chain = prompt | self.llm | StrOutputParser()
-        response = chain.invoke({"context": docs, "question": question})
+        # Stream the answer so callers see tokens early, and stop as soon as
+        # the model starts apologising instead of waiting for the full reply.
+        response = ""
+        async for chunk in self._generate_chain.astream({"context": docs, "question": question}):
+            # Only rescan the tail a phrase split across chunks could start in
+            scan_from = max(0, len(response) - _APOLOGY_MAX_LEN)
+            response += chunk
+            if _APOLOGY_RE.search(response, scan_from) is not None:
+                log.info("LLM response contains apology/fallback phrase. Triggering web search.")
+                # Pass the original question to web search
+                return {"messages": [HumanMessage(content="TOOL: websearch"), HumanMessage(content=question)]}
         # Prepend indicator to final output
         final_response = f"{indicator}\n{response}" if indicator else response
-        # Check for apology/fallback phrases in LLM output
-        apology_phrases = [
-            "i am sorry",
-            "cannot provide",
-            "not included",
-            "no relevant documents",
-            "not found"
-        ]
-        response_lower = final_response.lower()
-        if any(phrase in response_lower for phrase in apology_phrases):
-            import logging
-            logging.info("LLM response contains apology/fallback phrase. Triggering web search.")
-            # Pass the original question to web search
-            return {"messages": [HumanMessage(content="TOOL: websearch"), HumanMessage(content=question)]}
         return {"messages": [HumanMessage(content=final_response)]}
 
-    def _rewrite(self, state: AgentState):
-        print("--- REWRITE ---")
-        question = state["messages"][0].content
-        new_q = self.llm.invoke(
-            [HumanMessage(content=f"Rewrite the query to be clearer: {question}")]
-        )
-        return {"messages": [HumanMessage(content=new_q.content)]}
-    
-    def _web_search_node(self, state: 'AgenticRAG.AgentState'):
-        import re
+    async def _web_search_node(self, state: 'AgenticRAG.AgentState'):
         print("--- WEB SEARCH ---")
         # Get the original user query (first message), not the "TOOL: websearch" message
         query = state["messages"][0].content
-        context = self.web_search(query)
+        # Reuse the speculative result from the retriever node when available
+        context = state.get("web_context") or await self.aweb_search(query)
         indicator = "[Source: Web Search]"
-        # Normalize query and context for comparison
-        def normalize(text):
-            return re.sub(r'[^a-zA-Z0-9]', '', text).lower().strip()
-        query_norm = normalize(query)
-        context_norm = normalize(context)
         invalid_context = (
             not context or
-            context_norm == query_norm or
+            _echoes_query(context, query, state["query_norm"]) or
             "web search failed" in context.lower() or
             "no web results found" in context.lower() or
             "web search returned results, but none were usable" in context.lower()
@@ -240,15 +332,18 @@ class AgenticRAG:
         return {"messages": [HumanMessage(content=f"{indicator}\n{context}")]}
 
     # ---------- Build Workflow ----------
-    def _build_workflow(self):
-        workflow = StateGraph(self.AgentState)
-        workflow.add_node("Assistant", self._ai_assistant)
-        workflow.add_node("Retriever", self._vector_retriever)
-        workflow.add_node("WebSearch", self._web_search_node)
-        workflow.add_node("Generator", self._generate)
-        workflow.add_node("Rewriter", self._rewrite)
-
-        workflow.add_edge(START, "Assistant")
+    @classmethod
+    @functools.lru_cache(maxsize=1)
+    def _compiled_template(cls):
+        workflow = StateGraph(cls.AgentState)
+        workflow.add_node("Prepare", agent_node(cls, "_prepare"))
+        workflow.add_node("Assistant", agent_node(cls, "_ai_assistant"))
+        workflow.add_node("Retriever", agent_node(cls, "_vector_retriever"))
+        workflow.add_node("WebSearch", agent_node(cls, "_web_search_node"))
+        workflow.add_node("Generator", agent_node(cls, "_generate"))
+
+        workflow.add_edge(START, "Prepare")
+        workflow.add_edge("Prepare", "Assistant")
         workflow.add_conditional_edges(
             "Assistant",
             lambda state: "Retriever" if "TOOL" in state["messages"][-1].content else END,
@@ -256,30 +351,43 @@ class AgenticRAG:
         )
         workflow.add_conditional_edges(
             "Retriever",
-            lambda state: "WebSearch" if "TOOL: websearch" in [msg.content for msg in state["messages"]] else "generator",
-            {"WebSearch": "WebSearch", "generator": "Generator", "rewriter": "Rewriter"},
+            _route_after_retrieval,
+            {"WebSearch": "WebSearch", "generator": "Generator", END: END},
         )
         workflow.add_edge("WebSearch", END)
         workflow.add_edge("Generator", END)
-        workflow.add_edge("Rewriter", "Assistant")
         return workflow
 
     # ---------- Public Run ----------
-    def run(self, query: str, thread_id: str ="default_thread") -> str:
-        """Run the workflow for a given query and return the final answer."""
-        import re
-        result = self.app.invoke({"messages": [HumanMessage(content=query)]},
-                                 config= {"configurable":{"thread_id":thread_id}})
+    def _run_config(self, thread_id: str) -> dict:
+        return {"configurable": {"thread_id": thread_id, "agent": self}}
+
+    async def arun(self, query: str, thread_id: str = "default_thread") -> str:
+        """Async entrypoint: the whole graph runs on a single event loop."""
+        result = await self.app.ainvoke({"messages": [HumanMessage(content=query)], "web_context": ""},
+                                        config=self._run_config(thread_id))
         answer = result["messages"][-1].content
-        # Normalize query and answer for comparison
-        def normalize(text):
-            return re.sub(r'[^a-zA-Z0-9]', '', text).lower().strip()
-        query_norm = normalize(query)
-        answer_norm = normalize(answer)
-        if answer_norm == query_norm:
+        if _echoes_query(answer, query, result["query_norm"]):
             return f"No price information found online for {query.strip()}."
         return answer
 
+    async def astream_answer(self, query: str, thread_id: str = "default_thread"):
+        """Yield the generator's answer token by token as the workflow runs."""
+        streamed = False
+        async for chunk, metadata in self.app.astream(
+            {"messages": [HumanMessage(content=query)], "web_context": ""},
+            config=self._run_config(thread_id),
+            stream_mode="messages",
+        ):
+            if metadata.get("langgraph_node") == "Generator" and chunk.content:
+                streamed = True
+                yield chunk.content
+        if not streamed:
+            # Answer did not come from the Generator (direct price lookup, web search, assistant)
+            messages = self.get_history(thread_id)
+            if messages:
+                yield messages[-1].content
+
 
 if __name__ == "__main__":
     rag_agent = AgenticRAG()
@@ -8,14 +8,14 @@ from langgraph.graph.message import add_messages
 from product_assistant.prompt_library.prompts import PROMPT_REGISTRY, PromptType
 from product_assistant.retriever.retrieval import Retriever
 from product_assistant.utils.model_loader import ModelLoader
-from langgraph.checkpoint.memory import MemorySaver
+from product_assistant.workflow.checkpointer import FastMemorySaver
+from product_assistant.workflow.graph_nodes import ROUTE_KEYWORDS, AgentRunner, agent_node
 import asyncio
-import signal
-from product_assistant.evaluation.ragas_eval import evaluate_context_precision, evaluate_response_relevancy
+import functools
 from langchain_mcp_adapters.client import MultiServerMCPClient
 
 
-class AgenticRAG:
+class AgenticRAG(AgentRunner):
     """Agentic RAG pipeline using LangGraph + MCP (Retriever + WebSearch)."""
 
     class AgentState(TypedDict):
@@ -26,11 +26,23 @@ class AgenticRAG:
         self.retriever_obj = Retriever()
         self.model_loader = ModelLoader()
         self.llm = self.model_loader.load_llm()
-        self.checkpointer = MemorySaver()
+        self._assistant_chain = ChatPromptTemplate.from_template(
+            "You are a helpful assistant. Answer the user directly.\n\nQuestion: {question}\nAnswer:"
+        ) | self.llm | StrOutputParser()
+        self._generate_prompt = ChatPromptTemplate.from_template(
+            PROMPT_REGISTRY[PromptType.PRODUCT_BOT].template
+        )
+        self._generate_chain = self._generate_prompt | self.llm | StrOutputParser()
+        self._rewrite_chain = ChatPromptTemplate.from_template(
+            "Rewrite this user query to make it more clear and specific for a search engine. "
+            "Do NOT answer the query. Only rewrite it.\n\nQuery: {question}\nRewritten Query:"
+        ) | self.llm | StrOutputParser()
+        self.checkpointer = FastMemorySaver()
 
         # MCP Client Init with fallback
         self.mcp_tools = []
         self.mcp_enabled = False
+        self.mcp_client = None
         
         try:
             import os
@@ -45,31 +57,34 @@ class AgenticRAG:
                         "transport": "stdio"
                     }
                 })
-                # Load MCP tools with timeout
-                def timeout_handler(signum, frame):
-                    raise TimeoutError("MCP initialization timeout")
-                
-                signal.signal(signal.SIGALRM, timeout_handler)
-                signal.alarm(10)  # 10 second timeout
-                
-                try:
-                    self.mcp_tools = asyncio.run(self.mcp_client.get_tools())
-                    self.mcp_enabled = True
-                    print("MCP tools loaded successfully")
-                except Exception as e:
-                    print(f"Warning: MCP tools failed to load: {e}")
-                finally:
-                    signal.alarm(0)  # Cancel the alarm
+                # Tools are loaded on the caller's loop by the first arun()
             else:
                 print(f"MCP server not found at {server_path}")
                 
         except Exception as e:
             print(f"Warning: MCP initialization failed: {e}")
 
-        self.workflow = self._build_workflow()
+        self.workflow = type(self)._compiled_template()
         self.app = self.workflow.compile(checkpointer=self.checkpointer)
 
     # ---------- Helpers ----------
+    async def _load_mcp_tools(self):
+        """Load MCP tools once, with a timeout, on the running event loop."""
+        if self.mcp_client is None or self.mcp_enabled:
+            return
+        try:
+            self.mcp_tools = await asyncio.wait_for(self.mcp_client.get_tools(), timeout=10)
+            self.mcp_enabled = True
+            print("MCP tools loaded successfully")
+        except asyncio.TimeoutError:
+            print("Warning: MCP tools failed to load: MCP initialization timeout")
+        except Exception as e:
+            print(f"Warning: MCP tools failed to load: {e}")
+        finally:
+            # Fall back to regular retrieval for this instance instead of retrying per query
+            if not self.mcp_enabled:
+                self.mcp_client = None
+
     def _format_docs(self, docs) -> str:
         if not docs:
             return "No relevant documents found."
@@ -86,24 +101,21 @@ class AgenticRAG:
         return "\n\n---\n\n".join(formatted_chunks)
 
     # ---------- Nodes ----------
-    def _ai_assistant(self, state: AgentState):
+    async def _ai_assistant(self, state: AgentState):
         print("--- CALL ASSISTANT ---")
         messages = state["messages"]
         last_message = messages[-1].content
 
-        if any(word in last_message.lower() for word in ["price", "review", "product"]):
+        text = last_message.lower()
+        if any(keyword in text for keyword in ROUTE_KEYWORDS):
             return {"messages": [HumanMessage(content="TOOL: retriever")]}
         else:
-            prompt = ChatPromptTemplate.from_template(
-                "You are a helpful assistant. Answer the user directly.\n\nQuestion: {question}\nAnswer:"
-            )
-            chain = prompt | self.llm | StrOutputParser()
-            response = chain.invoke({"question": last_message})
+            response = await self._assistant_chain.ainvoke({"question": last_message})
             return {"messages": [HumanMessage(content=response)]}
 
 
 
-    def _vector_retriever(self, state: AgentState):
+    async def _vector_retriever(self, state: AgentState):
         print("--- RETRIEVER (MCP/Fallback) ---")
         query = state["messages"][0].content  # Use original query instead of last message
         
@@ -113,8 +125,7 @@ class AgenticRAG:
                 # Find the tool by name
                 tool = next((t for t in self.mcp_tools if t.name == "get_product_info"), None)
                 if tool:
-                    # Call the tool (sync wrapper)
-                    result = asyncio.run(tool.ainvoke({"query": query}))
+                    result = await tool.ainvoke({"query": query})
                     context = result if result else "No MCP data found"
                     print(f"MCP result: {context[:100]}...")
                     return {"messages": [HumanMessage(content=context)]}
@@ -123,12 +134,12 @@ class AgenticRAG:
         
         # Fallback to regular retrieval
         print("Using regular vector retrieval")
-        docs = self.retriever_obj.call_retriever(query)
+        docs = await self.retriever_obj.load_retriever().ainvoke(query)
         context = self._format_docs(docs) if hasattr(self, '_format_docs') else str(docs)
         print(f"Retrieved {len(docs) if docs else 0} documents")
         return {"messages": [HumanMessage(content=context)]}
 
-    def _web_search(self, state: AgentState):
+    async def _web_search(self, state: AgentState):
         print("--- WEB SEARCH (MCP/Fallback) ---")
         query = state["messages"][0].content  # Use original query instead of last message
         
@@ -138,8 +149,7 @@ class AgenticRAG:
                 # Find the tool by name
                 tool = next((t for t in self.mcp_tools if t.name == "web_search"), None)
                 if tool:
-                    # Call the tool (sync wrapper)
-                    result = asyncio.run(tool.ainvoke({"query": query}))
+                    result = await tool.ainvoke({"query": query})
                     context = result if result else "No web search data found"
                     print(f"Web search result: {context[:100]}...")
                     return {"messages": [HumanMessage(content=context)]}
@@ -177,18 +187,14 @@ class AgenticRAG:
         print("Documents not sufficient, rewriting query")
         return "rewriter"
 
-    def _generate(self, state: AgentState):
+    async def _generate(self, state: AgentState):
         print("--- GENERATE ---")
         question = state["messages"][0].content
         docs = state["messages"][-1].content
-        prompt = ChatPromptTemplate.from_template(
-            PROMPT_REGISTRY[PromptType.PRODUCT_BOT].template
-        )
-        chain = prompt | self.llm | StrOutputParser()
-        response = chain.invoke({"context": docs, "question": question})
+        response = await self._generate_chain.ainvoke({"context": docs, "question": question})
         return {"messages": [HumanMessage(content=response)]}
 
-    def _rewrite(self, state: AgentState):
+    async def _rewrite(self, state: AgentState):
         print("--- REWRITE ---")
         retry_count = state.get("retry_count", 0)
         
@@ -198,23 +204,20 @@ class AgenticRAG:
             return {"messages": [HumanMessage(content=state["messages"][0].content)]}
         
         question = state["messages"][0].content
-        prompt = ChatPromptTemplate.from_template(
-            "Rewrite this user query to make it more clear and specific for a search engine. "
-            "Do NOT answer the query. Only rewrite it.\n\nQuery: {question}\nRewritten Query:"
-        )
-        chain = prompt | self.llm | StrOutputParser()
-        new_q = chain.invoke({"question": question})
+        new_q = await self._rewrite_chain.ainvoke({"question": question})
         return {"messages": [HumanMessage(content=new_q.strip())], "retry_count": retry_count + 1}
 
 
     # ---------- Build Workflow ----------
-    def _build_workflow(self):
-        workflow = StateGraph(self.AgentState)
-        workflow.add_node("Assistant", self._ai_assistant)
-        workflow.add_node("Retriever", self._vector_retriever)
-        workflow.add_node("Generator", self._generate)
-        workflow.add_node("Rewriter", self._rewrite)
-        workflow.add_node("WebSearch", self._web_search)
+    @classmethod
+    @functools.lru_cache(maxsize=1)
+    def _compiled_template(cls):
+        workflow = StateGraph(cls.AgentState)
+        workflow.add_node("Assistant", agent_node(cls, "_ai_assistant"))
+        workflow.add_node("Retriever", agent_node(cls, "_vector_retriever"))
+        workflow.add_node("Generator", agent_node(cls, "_generate"))
+        workflow.add_node("Rewriter", agent_node(cls, "_rewrite"))
+        workflow.add_node("WebSearch", agent_node(cls, "_web_search"))
 
         workflow.add_edge(START, "Assistant")
         workflow.add_conditional_edges(
@@ -224,7 +227,7 @@ class AgenticRAG:
         )
         workflow.add_conditional_edges(
             "Retriever",
-            self._grade_documents,
+            agent_node(cls, "_grade_documents"),
             {"generator": "Generator", "rewriter": "Rewriter"},
         )
         workflow.add_edge("Generator", END)
@@ -236,11 +239,13 @@ class AgenticRAG:
         return workflow
 
     # ---------- Public Run ----------
-    def run(self, query: str, thread_id: str = "default_thread") -> str:
-        """Run the workflow for a given query and return the final answer."""
-        result = self.app.invoke(
+    async def arun(self, query: str, thread_id: str = "default_thread") -> str:
+        """Async entrypoint: every node runs on the caller's event loop, so cancelling
+        this coroutine (e.g. via asyncio.wait_for) stops the workflow."""
+        await self._load_mcp_tools()
+        result = await self.app.ainvoke(
             {"messages": [HumanMessage(content=query)], "retry_count": 0},
-            config={"configurable": {"thread_id": thread_id}}
+            config={"configurable": {"thread_id": thread_id, "agent": self}}
         )
         return result["messages"][-1].content
 
@@ -0,0 +1,16 @@
+from langgraph.checkpoint.memory import MemorySaver
+
+
+class FastMemorySaver(MemorySaver):
+    """MemorySaver with a cheap accessor for the stored conversation.
+
+    `CompiledStateGraph.get_state` rebuilds the full StateSnapshot (tasks,
+    next nodes, interrupts) on every call; when only the messages are needed,
+    reading the raw checkpoint through `get_tuple` is orders of magnitude cheaper.
+    """
+
+    def get_messages(self, config) -> list:
+        checkpoint_tuple = self.get_tuple(config)
+        if checkpoint_tuple is None:
+            return []
+        return checkpoint_tuple.checkpoint["channel_values"].get("messages", [])
@@ -0,0 +1,37 @@
+import asyncio
+
+from langchain_core.runnables import RunnableConfig
+
+# Product/catalog queries go straight to the retriever without an LLM hop
+ROUTE_KEYWORDS = frozenset(["price", "review", "product", "buy", "cost"])
+
+
+def agent_node(cls, name: str):
+    """Wrap `cls.<name>` as a graph node that runs on the instance passed as
+    `configurable["agent"]`, so a graph compiled once per class serves every instance."""
+    if asyncio.iscoroutinefunction(getattr(cls, name)):
+        async def node(state, config: RunnableConfig):
+            return await getattr(config["configurable"]["agent"], name)(state)
+    else:
+        def node(state, config: RunnableConfig):
+            return getattr(config["configurable"]["agent"], name)(state)
+    node.__name__ = name
+    return node
+
+
+class AgentRunner:
+    """Sync entrypoint and history access shared by the workflow agents.
+
+    Subclasses provide `arun()` and a `checkpointer`."""
+
+    def run(self, query: str, thread_id: str = "default_thread") -> str:
+        """Run the workflow for a given query and return the final answer.
+
+        Drives arun() with asyncio.run(), so it must not be called from a running
+        event loop (e.g. an async FastAPI handler); await arun() there instead.
+        """
+        return asyncio.run(self.arun(query, thread_id=thread_id))
+
+    def get_history(self, thread_id: str = "default_thread"):
+        """Return the stored messages for a thread without materializing full graph state."""
+        return self.checkpointer.get_messages({"configurable": {"thread_id": thread_id}})
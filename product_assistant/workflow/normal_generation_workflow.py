@@ -1,110 +1,310 @@
+import asyncio
+import operator
+import re
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from typing import Annotated, Sequence, TypedDict, Literal
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import BaseMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langchain_core.runnables import RunnablePassthrough
 
 from product_assistant.prompt_library.prompts import PROMPT_REGISTRY, PromptType
 from product_assistant.retriever.retrieval import Retriever
 from product_assistant.utils.model_loader import ModelLoader
-from product_assistant.evaluation.ragas_eval import evaluate_context_precision, evaluate_response_relevancy
+from product_assistant.utils.query_cache import QueryCache, prompt_hash
+from product_assistant.evaluation.ragas_eval import evaluate_batch
 
 retriever_obj = Retriever()
 model_loader = ModelLoader()
+# Heavy clients are built once at import and shared by every node/query
 llm = model_loader.load_llm()
+retriever = retriever_obj.load_retriever()
+
+# ---------- Prompts & Chains (parsed once at import) ----------
+_ASSISTANT_TEMPLATE = "You are a helpful assistant. Answer the user directly.\n\nQuestion: {question}\nAnswer:"
+_ASSISTANT_PROMPT = ChatPromptTemplate.from_template(_ASSISTANT_TEMPLATE)
+_CLASSIFIER_PROMPT = ChatPromptTemplate.from_template(
+    "Does answering this question require looking up products in the store catalog? "
+    "Reply with exactly one word: retrieve or direct.\n\nQuestion: {question}\nAnswer:"
+)
+_GRADER_PROMPT = PromptTemplate(
+    template="""You are a grader. Question: {question}\nDocs: {docs}\n
+    Are docs relevant to the question? Reply only with JSON: {{"relevant": "yes"}} or {{"relevant": "no"}}.""",
+    input_variables=["question", "docs"],
+)
+# Static instructions go first as a system message so the prefix is identical
+# on every call; only the context/question tail varies
+_PRODUCT_BOT_STATIC, _PRODUCT_BOT_DYNAMIC = PROMPT_REGISTRY[PromptType.PRODUCT_BOT].split_static_prefix()
+_GENERATE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", _PRODUCT_BOT_STATIC),
+    ("human", _PRODUCT_BOT_DYNAMIC),
+])
+
+# Slim prompts for frequent query shapes; other intents use PRODUCT_BOT
+INTENT_PROMPTS: dict[str, ChatPromptTemplate] = {
+    "price": ChatPromptTemplate.from_template(
+        "Products:\n{context}\n\nUsing only the products above, state the price asked for. "
+        "Say so if it is not listed.\nQuestion: {question}"
+    ),
+    "compare": ChatPromptTemplate.from_template(
+        "Products:\n{context}\n\nCompare the products asked about by price, rating and reviews "
+        "in a few short bullet points.\nQuestion: {question}"
+    ),
+    "recommend": ChatPromptTemplate.from_template(
+        "Products:\n{context}\n\nRecommend the best matching products from the list above, "
+        "one line each with price and rating.\nQuestion: {question}"
+    ),
+}
+_INTENT_RE = re.compile(
+    r"\b(?:(?P<compare>compar|versus\b|vs\b)|(?P<recommend>recommend|suggest|best\b)|(?P<price>price|cost))",
+    re.IGNORECASE,
+)
+
+ASSISTANT_CHAIN = _ASSISTANT_PROMPT | llm | StrOutputParser()
+CLASSIFIER_CHAIN = _CLASSIFIER_PROMPT | llm | StrOutputParser()
+GRADER_CHAIN = _GRADER_PROMPT | llm | StrOutputParser()
+GENERATE_CHAIN = _GENERATE_PROMPT | llm | StrOutputParser()
+INTENT_CHAINS = {intent: prompt | llm | StrOutputParser() for intent, prompt in INTENT_PROMPTS.items()}
+
+# Providers without a native async client fall back to LangChain's default
+# _agenerate, which runs each call on the loop's shared executor; fan those
+# out on a dedicated pool instead (the calls are I/O bound and release the GIL)
+_NATIVE_ASYNC_LLM = type(llm)._agenerate is not BaseChatModel._agenerate
+_POOL = ThreadPoolExecutor(max_workers=8)
+
+# Repeated queries skip the vector DB / LLM round-trip
+_RETRIEVAL_CACHE = QueryCache(max_size=256, ttl_seconds=600)
+_LLM_CACHE = QueryCache(max_size=256, ttl_seconds=600)
+# Formatted doc strings by doc ID, shared across queries and batch retrievals
+_FORMATTED_CACHE = QueryCache(max_size=4096, ttl_seconds=3600)
+_ASSISTANT_HASH = prompt_hash(_ASSISTANT_TEMPLATE)
+_PRODUCT_BOT_HASH = prompt_hash(PROMPT_REGISTRY[PromptType.PRODUCT_BOT].template)
+
+
+# Product queries route to the retriever; one compiled scan, no lower() copy.
+# Only the leading edge is anchored so "prices"/"reviews"/"products" still match.
+_ROUTE_RE = re.compile(r"\b(?:price|review|product)", re.IGNORECASE)
+
+# Verdict scans for LLM replies, matched case-insensitively without lower() copies
+_YES_RE = re.compile(r"\b(?:yes|true)\b", re.IGNORECASE)
+_RETRIEVE_RE = re.compile(r"\bretrieve\b", re.IGNORECASE)
+
+# Lexical grading: scores in the ambiguous band fall back to the LLM grader
+_WORD_RE = re.compile(r"\w+")
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "about", "any", "be", "best", "can", "do", "does",
+    "for", "from", "give", "good", "how", "i", "in", "is", "it", "me", "my",
+    "of", "on", "or", "please", "show", "some", "suggest", "tell", "that",
+    "the", "this", "to", "under", "what", "which", "with", "you", "your",
+])
+# _DOC_TMPL labels ("Price: N/A" included) and the routing keywords that got the
+# query here match every rendered context, so they carry no relevance signal
+_TEMPLATE_TOKENS = frozenset([
+    "title", "price", "prices", "rating", "reviews", "review", "product", "products", "cost", "n",
+])
+GRADE_THRESHOLD = 0.15
+GRADE_AMBIGUOUS = (0.10, 0.20)
+# Rewrite→Assistant cycles allowed before answering with the docs we have
+MAX_REWRITE_ATTEMPTS = 2
 
 
 # ---------- State Definition ----------
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    attempts: Annotated[int, operator.add]
+    # Retrieved context lives outside `messages` so it skips the add_messages reducer
+    docs: str
+    # Query shape picked in ai_assistant; selects the generator prompt
+    intent: str
 
 
 # ---------- Helper for formatting ----------
+_DOC_TMPL = "Title: {product_title}\nPrice: {price}\nRating: {rating}\nReviews:\n{content}"
+
+
+class _SafeDict(dict):
+    """Metadata view for format_map that renders missing fields as N/A."""
+
+    def __missing__(self, key):
+        return "N/A"
+
+
+def _format_doc(d) -> str:
+    """Format one doc, reusing the string cached on the doc or under its ID."""
+    meta = d.metadata if d.metadata is not None else {}
+    formatted = meta.get("_formatted")
+    if formatted is not None:
+        return formatted
+    doc_id = getattr(d, "id", None) or meta.get("id") or meta.get("_id")
+    if doc_id is not None:
+        formatted = _FORMATTED_CACHE.get(str(doc_id))
+    if formatted is None:
+        formatted = _DOC_TMPL.format_map(_SafeDict(meta, content=d.page_content.strip()))
+        if doc_id is not None:
+            _FORMATTED_CACHE.set(str(doc_id), formatted)
+    if d.metadata is not None:
+        d.metadata["_formatted"] = formatted
+    return formatted
+
+
 def format_docs(docs) -> str:
     if not docs:
         return "No relevant documents found."
-    formatted_chunks = []
-    for d in docs:
-        meta = d.metadata or {}
-        formatted = (
-            f"Title: {meta.get('product_title', 'N/A')}\n"
-            f"Price: {meta.get('price', 'N/A')}\n"
-            f"Rating: {meta.get('rating', 'N/A')}\n"
-            f"Reviews:\n{d.page_content.strip()}"
-        )
-        formatted_chunks.append(formatted)
-    return "\n\n---\n\n".join(formatted_chunks)
+    return "\n\n---\n\n".join(_format_doc(d) for d in docs)
+
+
+async def aretrieve(query: str):
+    """Retrieve docs for `query`, served from the retrieval cache when possible."""
+    docs = _RETRIEVAL_CACHE.get(query)
+    if docs is None:
+        # The embeddings' async client is bound to the import-time loop, so the
+        # sync retriever runs on a worker thread instead of via ainvoke
+        docs = await asyncio.to_thread(retriever.invoke, query)
+        _RETRIEVAL_CACHE.set(query, docs)
+    return docs
+
+
+def relevance_score(question: str, docs: str) -> float:
+    """Fraction of the question's content words that appear in the docs' titles and reviews."""
+    q_tokens = set(_WORD_RE.findall(question.lower())) - STOPWORDS - _TEMPLATE_TOKENS
+    doc_tokens = set(_WORD_RE.findall(docs.lower())) - _TEMPLATE_TOKENS
+    return len(q_tokens & doc_tokens) / max(len(q_tokens), 1)
+
+
+def detect_intent(query: str) -> str:
+    """Return "price", "compare" or "recommend" for known query shapes, else ""."""
+    match = _INTENT_RE.search(query)
+    return match.lastgroup if match else ""
+
+
+def _is_relevant(verdict: str) -> bool:
+    """Read the grader's JSON verdict, falling back to a yes/no scan for free text."""
+    try:
+        relevant = orjson.loads(verdict)["relevant"]
+    except (orjson.JSONDecodeError, KeyError, TypeError):
+        return _YES_RE.search(verdict) is not None
+    if isinstance(relevant, str):
+        return _YES_RE.search(relevant) is not None
+    return bool(relevant)
+
+
+def _is_ambiguous(score: float) -> bool:
+    return GRADE_AMBIGUOUS[0] < score < GRADE_AMBIGUOUS[1]
+
+
+async def _fan_out(chain, inputs: list) -> list:
+    """Run `chain` over `inputs` concurrently: abatch on native async LLMs, else threads."""
+    if not inputs:
+        return []
+    if _NATIVE_ASYNC_LLM:
+        return await chain.abatch(inputs)
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(loop.run_in_executor(_POOL, chain.invoke, x) for x in inputs))
 
 
 # ---------- Nodes ----------
-def ai_assistant(state: AgentState):
+async def ai_assistant(state: AgentState):
     """Decide whether to call retriever or just answer directly."""
     print("--- CALL ASSISTANT ---")
     messages = state["messages"]
     last_message = messages[-1].content
 
     # Simple routing: if query mentions product → go retriever
-    if any(word in last_message.lower() for word in ["price", "review", "product"]):
-        return {"messages": [HumanMessage(content="TOOL: retriever")]}
+    if _ROUTE_RE.search(last_message):
+        return {"messages": [HumanMessage(content="TOOL: retriever")], "intent": detect_intent(last_message)}
+
+    # No keyword: classify with the LLM while retrieval runs speculatively,
+    # so the retriever path does not pay for both calls back to back
+    retrieval_task = asyncio.create_task(aretrieve(last_message))
+    try:
+        verdict = await CLASSIFIER_CHAIN.ainvoke({"question": last_message})
+    except Exception as e:
+        print(f"Classifier failed: {e}, answering directly")
+        verdict = "direct"
+
+    if _RETRIEVE_RE.search(verdict):
+        try:
+            # Warms the retrieval cache for the Retriever node
+            await retrieval_task
+        except Exception as e:
+            print(f"Speculative retrieval failed: {e}")
+        return {"messages": [HumanMessage(content="TOOL: retriever")], "intent": detect_intent(last_message)}
     else:
+        retrieval_task.cancel()
         # direct answer without retriever
-        prompt = ChatPromptTemplate.from_template(
-            "You are a helpful assistant. Answer the user directly.\n\nQuestion: {question}\nAnswer:"
-        )
-        chain = prompt | llm | StrOutputParser()
-        response = chain.invoke({"question": last_message})
+        response = _LLM_CACHE.get(last_message, _ASSISTANT_HASH)
+        if response is None:
+            response = await ASSISTANT_CHAIN.ainvoke({"question": last_message})
+            _LLM_CACHE.set(last_message, response, _ASSISTANT_HASH)
         return {"messages": [HumanMessage(content=response)]}
 
 
-def vector_retriever(state: AgentState):
+async def vector_retriever(state: AgentState):
     """Fetch product info from vector DB."""
     print("--- RETRIEVER ---")
-    query = state["messages"][-1].content
-    retriever = retriever_obj.load_retriever()
-    docs = retriever.invoke(query)
+    # messages[-1] is the Assistant's "TOOL: retriever" marker; the query precedes it
+    query = state["messages"][-2].content
+    docs = await aretrieve(query)
     context = format_docs(docs)
-    return {"messages": [HumanMessage(content=context)]}
+    return {"docs": context, "messages": [HumanMessage(content="RETRIEVED")]}
 
 
-def grade_documents(state: AgentState) -> Literal["generator", "rewriter"]:
+async def grade_documents(state: AgentState) -> Literal["generator", "rewriter"]:
     """Grade docs relevance."""
     print("--- GRADER ---")
     question = state["messages"][0].content
-    docs = state["messages"][-1].content
-
-    prompt = PromptTemplate(
-        template="""You are a grader. Question: {question}\nDocs: {docs}\n
-        Are docs relevant to the question? Answer yes or no.""",
-        input_variables=["question", "docs"],
-    )
-    chain = prompt | llm | StrOutputParser()
-    score = chain.invoke({"question": question, "docs": docs})
-    return "generator" if "yes" in score.lower() else "rewriter"
+    docs = state.get("docs", "")
+
+    if state.get("attempts", 0) >= MAX_REWRITE_ATTEMPTS:
+        print("Max rewrites reached, generating from current docs")
+        return "generator"
+
+    score = relevance_score(question, docs)
+    if _is_ambiguous(score):
+        # Near the decision boundary: let the LLM grader decide
+        verdict = await GRADER_CHAIN.ainvoke({"question": question, "docs": docs})
+        return "generator" if _is_relevant(verdict) else "rewriter"
+    return "generator" if score > GRADE_THRESHOLD else "rewriter"
+
+
+async def grade_documents_batch(pairs) -> list[str]:
+    """Grade many (question, docs) pairs; only ambiguous ones reach the LLM, in one batch."""
+    pairs = list(pairs)
+    scores = [relevance_score(q, d) for q, d in pairs]
+    routes = ["generator" if score > GRADE_THRESHOLD else "rewriter" for score in scores]
+    ambiguous = [i for i, score in enumerate(scores) if _is_ambiguous(score)]
+    if ambiguous:
+        verdicts = await _fan_out(
+            GRADER_CHAIN, [{"question": pairs[i][0], "docs": pairs[i][1]} for i in ambiguous]
+        )
+        for i, verdict in zip(ambiguous, verdicts):
+            routes[i] = "generator" if _is_relevant(verdict) else "rewriter"
+    return routes
 
 
-def generate(state: AgentState):
+async def generate(state: AgentState):
     """Generate final answer with docs."""
     print("--- GENERATE ---")
     question = state["messages"][0].content
-    docs = state["messages"][-1].content
-    prompt = ChatPromptTemplate.from_template(
-        PROMPT_REGISTRY[PromptType.PRODUCT_BOT].template
-    )
-    chain = prompt | llm | StrOutputParser()
-    response = chain.invoke({"context": docs, "question": question})
+    docs = state.get("docs", "")
+    chain = INTENT_CHAINS.get(state.get("intent", ""), GENERATE_CHAIN)
+    # Streamed so graph callers using stream_mode="messages" see tokens as they arrive
+    chunks = [chunk async for chunk in chain.astream({"context": docs, "question": question})]
+    response = "".join(chunks)
     return {"messages": [HumanMessage(content=response)]}
 
 
-def rewrite(state: AgentState):
+async def rewrite(state: AgentState):
     """Rewrite bad query."""
     print("--- REWRITE ---")
     question = state["messages"][0].content
-    new_q = llm.invoke(
+    new_q = await llm.ainvoke(
         [HumanMessage(content=f"Rewrite the query to be clearer: {question}")]
     )
-    return {"messages": [HumanMessage(content=new_q.content)]}
+    return {"messages": [HumanMessage(content=new_q.content)], "attempts": 1}
 
 
 # ---------- Build Workflow ----------
@@ -129,59 +329,92 @@ workflow.add_conditional_edges(
 workflow.add_edge("Generator", END)
 workflow.add_edge("Rewriter", "Assistant")
 
+# Nodes are async: drive the graph with `await app.ainvoke(...)`
 app = workflow.compile()
 
 
-def build_chain(query):
-    """Build the RAG pipeline chain with retriever, prompt, LLM, and parser."""
-    retriever = retriever_obj.load_retriever()
-    retrieved_docs = retriever.invoke(query)
+async def build_chain(query):
+    """Retrieve context once and build the prompt, LLM, and parser chain."""
+    retrieved_docs = await aretrieve(query)
+    context = format_docs(retrieved_docs)
 
-    # Format all docs together for context evaluation
-    retrieved_contexts = [format_docs(retrieved_docs)] if retrieved_docs else ["No relevant documents found."]
+    # Context is passed in directly, so running the chain does no further retrieval
+    return GENERATE_CHAIN, context, [context]
 
-    llm = model_loader.load_llm()
-    prompt = ChatPromptTemplate.from_template(
-        PROMPT_REGISTRY[PromptType.PRODUCT_BOT].template
-    )
 
-    chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-    return chain, retrieved_contexts
+async def _astream_answer(chain, context: str, query: str):
+    cached = _LLM_CACHE.get(query, _PRODUCT_BOT_HASH)
+    if cached is not None:
+        yield cached
+        return
+    chunks = []
+    async for chunk in chain.astream({"context": context, "question": query}):
+        chunks.append(chunk)
+        yield chunk
+    _LLM_CACHE.set(query, "".join(chunks), _PRODUCT_BOT_HASH)
+
 
+async def astream_chain(query: str):
+    """Yield answer tokens for a user query as the LLM produces them."""
+    chain, context, _ = await build_chain(query)
+    async for chunk in _astream_answer(chain, context, query):
+        yield chunk
 
 
-def invoke_chain(query: str, debug: bool = False):
+async def invoke_chain(query: str, debug: bool = False):
     """Run the chain with a user query."""
     try:
-        chain, retrieved_contexts = build_chain(query)
+        chain, context, retrieved_contexts = await build_chain(query)
 
         if debug:
             # For debugging: show docs retrieved before passing to LLM
-            docs = retriever_obj.load_retriever().invoke(query)
             print("\nRetrieved Documents:")
-            print(format_docs(docs))
+            print(context)
             print("\n---\n")
 
-        response = chain.invoke(query)
+        # Full response for evaluation paths; use astream_chain for incremental output
+        response = "".join([chunk async for chunk in _astream_answer(chain, context, query)])
         return retrieved_contexts, response
     except Exception as e:
         print(f"Error during invoke_chain: {e}")
         return ["Error: could not retrieve contexts."], f"Error: {e}"
 
+
+async def invoke_chain_batch(queries: list[str]):
+    """Run the chain for many queries: one batched retrieval, concurrent LLM calls."""
+    try:
+        docs_by_query = {q: _RETRIEVAL_CACHE.get(q) for q in dict.fromkeys(queries)}
+        misses = [q for q, docs in docs_by_query.items() if docs is None]
+        if misses:
+            for q, docs in zip(misses, await asyncio.to_thread(retriever.batch, misses)):
+                _RETRIEVAL_CACHE.set(q, docs)
+                docs_by_query[q] = docs
+        contexts = [format_docs(docs_by_query[q]) for q in queries]
+
+        # Only queries without a cached answer reach the LLM
+        answers = {q: _LLM_CACHE.get(q, _PRODUCT_BOT_HASH) for q in dict.fromkeys(queries)}
+        pending = {q: c for q, c in zip(queries, contexts) if answers[q] is None}
+        generated = await _fan_out(
+            GENERATE_CHAIN, [{"context": c, "question": q} for q, c in pending.items()]
+        )
+        for q, answer in zip(pending, generated):
+            _LLM_CACHE.set(q, answer, _PRODUCT_BOT_HASH)
+            answers[q] = answer
+        responses = [answers[q] for q in queries]
+        return [[c] for c in contexts], responses
+    except Exception as e:
+        print(f"Error during invoke_chain_batch: {e}")
+        return [["Error: could not retrieve contexts."]] * len(queries), [f"Error: {e}"] * len(queries)
+
 # ---------- Run ----------
 if __name__ == "__main__":
     # Evaluate with RAGAS
     user_query = "Can you suggest good budget iPhone under 1,00,000 INR?"
     try:
-        retrieved_contexts, response = invoke_chain(user_query)
-        context_score = evaluate_context_precision(user_query, response, retrieved_contexts)
-        relevancy_score = evaluate_response_relevancy(user_query, response, retrieved_contexts)
-        print(f"Context Precision Score: {context_score}")
-        print(f"Relevancy Score: {relevancy_score}")
+        retrieved_contexts, response = asyncio.run(invoke_chain(user_query))
+        # Both metrics in one concurrent judge pass
+        scores = evaluate_batch([user_query], [response], [retrieved_contexts])
+        print(f"Context Precision Score: {scores['context_precision'][0]}")
+        print(f"Relevancy Score: {scores['response_relevancy'][0]}")
     except Exception as e:
         print(f"Error in main block: {e}")
\ No newline at end of file